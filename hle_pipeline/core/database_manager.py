@@ -4,28 +4,227 @@ Database Manager for HLE Quiz App
 Handles SQLite database operations for efficient question storage and retrieval.
 """
 
+import copy
 import sqlite3
 import json
+import math
 import os
-from typing import Dict, List, Optional, Tuple
+import pathlib
+import random
+import threading
+import time
+from collections.abc import Sized
+from itertools import islice
+from typing import Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
 try:
     import pandas as pd  # optional; not required for DB operations
 except Exception:
     pd = None
+try:
+    import orjson  # optional; faster (de)serialization of detailed_results
+except Exception:
+    orjson = None
+
+
+def _has_nonfinite(value) -> bool:
+    """True if value holds a NaN/inf float, which orjson would write as null"""
+    if isinstance(value, float):
+        return not math.isfinite(value)
+    if isinstance(value, dict):
+        return any(_has_nonfinite(k) or _has_nonfinite(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return any(_has_nonfinite(v) for v in value)
+    return False
+
+
+def _json_dumps(value) -> str:
+    """json.dumps-compatible output (same data on json.loads), via orjson when it can produce it"""
+    if orjson is not None:
+        try:
+            # OPT_NON_STR_KEYS: stringify int/float/bool/None keys like json does
+            out = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:  # orjson.JSONEncodeError, e.g. ints beyond 64 bits
+            pass
+        else:
+            # Only null-free output can have lost a NaN/Infinity (json keeps them)
+            if b"null" not in out or not _has_nonfinite(value):
+                return out.decode()
+    return json.dumps(value)
+
+
+def _json_loads(value):
+    if orjson is not None:
+        return orjson.loads(value)
+    return json.loads(value)
+
+# Seconds a cached per-filter count stays valid; also bounds
+# staleness when another process writes to the same database file.
+COUNT_CACHE_TTL = 30.0
+# Random picks tried by get_adaptive_question before falling back to SQL exclusion
+ADAPTIVE_MAX_PICKS = 8
+
+# Column order of the tuples accepted by insert_question_rows
+QUESTION_COLUMNS = (
+    "id", "question", "answer", "subject", "raw_subject", "difficulty",
+    "explanation", "question_type", "image", "question_length",
+)
+INSERT_QUESTION_SQL = (
+    f"INSERT OR IGNORE INTO questions ({', '.join(QUESTION_COLUMNS)}) "
+    f"VALUES ({', '.join(['?'] * len(QUESTION_COLUMNS))})"
+)
+
+# Canonical prefix for the count query (see also _select_questions_sql); filter
+# fragments are appended in a fixed order so each combination maps to one SQL string
+COUNT_QUESTIONS_SQL = "SELECT COUNT(*) FROM questions WHERE 1=1"
+# Columns returned by the question sampling methods unless the caller asks otherwise
+DEFAULT_QUESTION_FIELDS = (
+    "id", "question", "answer", "subject", "difficulty", "question_type", "image", "explanation",
+)
+# Statement cache size for the shared connection (all query shapes fit)
+CACHED_STATEMENTS = 256
+
+
+# (bucket, key, count) rows behind get_stats; also materialized into summary_counts at ingest
+SUMMARY_COUNTS_SQL = """
+    SELECT 'total', NULL, COUNT(*) FROM questions
+    UNION ALL
+    SELECT 'subject', subject, COUNT(*) FROM questions GROUP BY subject
+    UNION ALL
+    SELECT 'difficulty', difficulty, COUNT(*) FROM questions GROUP BY difficulty
+    UNION ALL
+    SELECT 'question_type', question_type, COUNT(*) FROM questions GROUP BY question_type
+    UNION ALL
+    SELECT 'raw_subject', raw_subject, COUNT(*) FROM questions
+    WHERE raw_subject != '' GROUP BY raw_subject
+"""
+
+
+def _select_questions_sql(columns: Tuple[str, ...]) -> str:
+    """Canonical `SELECT <columns> FROM questions WHERE 1=1` prefix for a projection"""
+    unknown = set(columns) - set(QUESTION_COLUMNS) - {"created_at"}
+    if unknown or not columns:
+        raise ValueError(f"Unknown question columns: {sorted(unknown) or columns}")
+    return f"SELECT {', '.join(columns)} FROM questions WHERE 1=1"
+
+
+def _rows_as_dicts(cursor: sqlite3.Cursor) -> List[Dict]:
+    """Fetch all rows of a tuple-returning cursor as dicts keyed by column name"""
+    names = [column[0] for column in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def _padded_in_list(values: List) -> Tuple[str, List]:
+    """
+    Build an IN-list placeholder string padded to a power of two (min 8) by
+    repeating the last value, so variable-length lists reuse a few cached
+    statements instead of preparing a new one per length.
+    """
+    size = 8
+    while size < len(values):
+        size *= 2
+    padded = list(values) + [values[-1]] * (size - len(values))
+    return ",".join(["?"] * size), padded
+
+
+# Rows per executemany batch during insert_questions
+INSERT_BATCH_SIZE = 500
+# Loads at least this large drop and rebuild the secondary indexes on questions
+BULK_INDEX_THRESHOLD = 5000
+
+# Secondary indexes on questions as (name, target)
+QUESTION_INDEXES = (
+    ("idx_subject", "questions(subject)"),
+    ("idx_difficulty", "questions(difficulty)"),
+    ("idx_question_type", "questions(question_type)"),
+    ("idx_raw_subject", "questions(raw_subject)"),
+    # Composite index for the filtered sampling paths (its leading columns also serve
+    # subject/difficulty/question_type-only filters); idx_qlen_bin serves the
+    # question_length difficulty_bin predicates.
+    ("idx_qlen", "questions(subject, difficulty, question_type, question_length)"),
+    ("idx_qlen_bin", "questions(question_length)"),
+)
+# Indexes earlier versions created that are now redundant; dropped by init_database
+RETIRED_INDEXES = (
+    "idx_filter",  # exact leading prefix of idx_qlen
+)
+
+# Applied once when the shared connection is opened
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+)
+# Applied to the read-only connection used by the SELECT paths
+READ_PRAGMAS = (
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA query_only=1",
+)
 
 class DatabaseManager:
     def __init__(self, db_path: str = "data/hle_quiz.db"):
         self.db_path = db_path
+        self._count_cache: Dict[Tuple, Tuple[float, int]] = {}
+        # Distinct-value lists, stats and the rowid index; cleared on writes (see _sync_caches)
+        self._meta_cache: Dict[object, object] = {}
+        self._data_version: Optional[int] = None
+        # Guards the two caches and _data_version only; never held while computing or writing
+        self._cache_lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        # Separate read-only connection so SELECTs never queue behind the writer (WAL)
+        self._ro_conn: Optional[sqlite3.Connection] = None
+        self._read_lock = threading.RLock()
         # Ensure parent directory exists (e.g., data/)
         parent_dir = os.path.dirname(self.db_path)
         if parent_dir and not os.path.exists(parent_dir):
             os.makedirs(parent_dir, exist_ok=True)
         self.init_database()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """Return the shared connection, opening and tuning it on first use"""
+        with self._lock:
+            if self._conn is None:
+                conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                                       cached_statements=CACHED_STATEMENTS)
+                conn.row_factory = sqlite3.Row  # Enable column access by name
+                for pragma in CONNECTION_PRAGMAS:
+                    conn.execute(pragma)
+                self._conn = conn
+            return self._conn
+
+    def _get_read_conn(self) -> sqlite3.Connection:
+        """Return the shared read-only connection, opening it on first use"""
+        with self._read_lock:
+            if self._ro_conn is None:
+                # as_uri() percent-escapes ?, # and % and handles drive letters
+                conn = sqlite3.connect(pathlib.Path(self.db_path).absolute().as_uri() + "?mode=ro", uri=True,
+                                       check_same_thread=False,
+                                       cached_statements=CACHED_STATEMENTS)
+                # Plain tuples: read paths zip them with known column names into dicts,
+                # skipping the per-row sqlite3.Row wrapper
+                for pragma in READ_PRAGMAS:
+                    conn.execute(pragma)
+                self._ro_conn = conn
+            return self._ro_conn
+
+    def close(self):
+        """Close the shared connections (reopened lazily on next use)"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        with self._read_lock:
+            if self._ro_conn is not None:
+                self._ro_conn.close()
+                self._ro_conn = None
     
     def init_database(self):
         """Initialize the database with proper tables and indexes"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._lock, self._get_conn() as conn:
             cursor = conn.cursor()
             
             # Create questions table
@@ -40,6 +239,7 @@ class DatabaseManager:
                     explanation TEXT,
                     question_type TEXT,
                     image TEXT,
+                    question_length INTEGER,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             """)
@@ -60,222 +260,424 @@ class DatabaseManager:
                 )
             """)
             
+            # Per-dimension counts, rewritten after every load so readers
+            # (e.g. the MCP server's summary) skip the GROUP BY scans
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS summary_counts (
+                    bucket TEXT NOT NULL,
+                    key TEXT,
+                    count INTEGER NOT NULL
+                )
+            """)
+            
+            # Migrate databases created before question_length existed
+            columns = {row[1] for row in cursor.execute("PRAGMA table_info(questions)")}
+            if "question_length" not in columns:
+                cursor.execute("ALTER TABLE questions ADD COLUMN question_length INTEGER")
+                cursor.execute("UPDATE questions SET question_length = LENGTH(question)")
+            
             # Create indexes for fast querying
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_subject ON questions(subject)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_difficulty ON questions(difficulty)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_question_type ON questions(question_type)")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_raw_subject ON questions(raw_subject)")
+            for name in RETIRED_INDEXES:
+                cursor.execute(f"DROP INDEX IF EXISTS {name}")
+            for name, target in QUESTION_INDEXES:
+                cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_results_timestamp ON user_results(timestamp)")
             cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_results_user_id ON user_results(user_id)")
+            # Lets per-user "latest N results" stop after N index entries instead of sorting
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_results_user_ts ON user_results(user_id, timestamp)")
+            
+            # Backfill summary_counts for databases loaded before it existed
+            if cursor.execute("SELECT 1 FROM summary_counts LIMIT 1").fetchone() is None:
+                self._refresh_summary_counts(cursor)
             
             conn.commit()
     
     def insert_questions(self, questions: List[Dict]) -> int:
         """Insert questions into the database"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            # Prepare data for insertion
-            data = []
-            for q in questions:
-                data.append((
-                    q.get('id', ''),
-                    q.get('question', ''),
-                    q.get('answer', ''),
-                    q.get('subject', 'Other'),
-                    q.get('raw_subject', ''),
-                    q.get('difficulty', 'Intermediate'),
-                    q.get('explanation', ''),
-                    q.get('question_type', 'text'),
-                    q.get('image', '')
-                ))
-            
-            # Insert with conflict resolution (ignore duplicates)
-            cursor.executemany("""
-                INSERT OR IGNORE INTO questions 
-                (id, question, answer, subject, raw_subject, difficulty, explanation, question_type, image)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, data)
-            
-            conn.commit()
-            return cursor.rowcount
+        # Prepare data for insertion
+        data = []
+        for q in questions:
+            data.append((
+                q.get('id', ''),
+                q.get('question', ''),
+                q.get('answer', ''),
+                q.get('subject', 'Other'),
+                q.get('raw_subject', ''),
+                q.get('difficulty', 'Intermediate'),
+                q.get('explanation', ''),
+                q.get('question_type', 'text'),
+                q.get('image', ''),
+                len(q.get('question', ''))
+            ))
+        return self.insert_question_rows(data)
+
+    def insert_question_rows(self, rows: Iterable[Tuple]) -> int:
+        """
+        Bulk-insert prebuilt question tuples ordered as QUESTION_COLUMNS.
+
+        Iterators (of unknown length) are consumed in INSERT_BATCH_SIZE chunks and
+        treated as bulk loads.
+        """
+        with self._lock:
+            conn = self._get_conn()
+            # Bulk-load settings: skip fsync while loading; the single transaction
+            # below still keeps the load atomic.
+            conn.execute("PRAGMA synchronous=OFF")
+            try:
+                with conn:
+                    cursor = conn.cursor()
+                    cursor.execute("BEGIN IMMEDIATE")
+
+                    # Large loads are cheaper with secondary indexes rebuilt once at the end
+                    rebuild_indexes = not isinstance(rows, Sized) or len(rows) >= BULK_INDEX_THRESHOLD
+                    if rebuild_indexes:
+                        for name, _ in QUESTION_INDEXES:
+                            cursor.execute(f"DROP INDEX IF EXISTS {name}")
+
+                    # Insert with conflict resolution (ignore duplicates)
+                    inserted = 0
+                    iterator = iter(rows)
+                    while True:
+                        batch = list(islice(iterator, INSERT_BATCH_SIZE))
+                        if not batch:
+                            break
+                        cursor.executemany(INSERT_QUESTION_SQL, batch)
+                        inserted += cursor.rowcount
+
+                    if rebuild_indexes:
+                        for name, target in QUESTION_INDEXES:
+                            cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+
+                    if inserted:
+                        self._refresh_summary_counts(cursor)
+            finally:
+                conn.execute("PRAGMA synchronous=NORMAL")
+
+            # Refresh planner statistics so the composite indexes get picked
+            if inserted:
+                conn.execute("ANALYZE questions")
+
+        self._invalidate_caches()
+        return inserted
     
-    def get_random_questions(self, num_questions: int = 5, 
-                           subject: Optional[str] = None, 
-                           difficulty: Optional[str] = None,
-                           question_type: Optional[str] = None) -> List[Dict]:
-        """Get random questions with optional filtering"""
-        query = "SELECT * FROM questions WHERE 1=1"
-        params = []
-        
+    def _refresh_summary_counts(self, cursor: sqlite3.Cursor):
+        """Rewrite summary_counts from questions (runs inside the caller's transaction)"""
+        cursor.execute("DELETE FROM summary_counts")
+        cursor.execute(f"INSERT INTO summary_counts (bucket, key, count) {SUMMARY_COUNTS_SQL}")
+    
+    def _filter_clauses(self,
+                        subject: Optional[str] = None,
+                        difficulty: Optional[str] = None,
+                        question_type: Optional[str] = None,
+                        difficulty_bin: Optional[str] = None) -> Tuple[List[str], List]:
+        """Build the WHERE fragments and parameters shared by the sampling queries"""
+        clauses: List[str] = []
+        params: List = []
+
         if subject and subject != "All":
-            query += " AND subject = ?"
+            clauses.append("AND subject = ?")
             params.append(subject)
-        
+
+        # The dataset's difficulty is mostly 'Intermediate'; keep for forward-compat
         if difficulty and difficulty != "All":
-            query += " AND difficulty = ?"
+            clauses.append("AND difficulty = ?")
             params.append(difficulty)
-        
+
         if question_type and question_type != "All":
-            query += " AND question_type = ?"
+            clauses.append("AND question_type = ?")
             params.append(question_type)
-        
-        query += f" ORDER BY RANDOM() LIMIT {num_questions}"
-        
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row  # Enable column access by name
+
+        # Apply length-based difficulty proxy if requested (question_length is
+        # LENGTH(question), precomputed at insert time so the predicate is indexable)
+        # easy: question_length < 120
+        # medium: 120 <= question_length <= 240
+        # hard: question_length > 240
+        if difficulty_bin == "easy":
+            clauses.append("AND question_length < 120")
+        elif difficulty_bin == "medium":
+            clauses.append("AND question_length BETWEEN 120 AND 240")
+        elif difficulty_bin == "hard":
+            clauses.append("AND question_length > 240")
+
+        return clauses, params
+
+    def _count_cached(self, filter_key: Tuple) -> int:
+        """
+        Return the row count for a (subject, difficulty, question_type, difficulty_bin)
+        filter combination, memoized for COUNT_CACHE_TTL seconds.
+        """
+        now = time.monotonic()
+        cached = self._count_cache.get(filter_key)
+        if cached and now - cached[0] < COUNT_CACHE_TTL:
+            return cached[1]
+
+        clauses, params = self._filter_clauses(*filter_key)
+        query = " ".join([COUNT_QUESTIONS_SQL, *clauses])
+        with self._read_lock, self._get_read_conn() as conn:
+            count = conn.execute(query, params).fetchone()[0]
+
+        self._count_cache[filter_key] = (now, count)
+        return count
+
+    def _build_rowid_index(self) -> Dict[Tuple, List[int]]:
+        """Group every question rowid by (subject, difficulty, question_type)"""
+        index: Dict[Tuple, List[int]] = {}
+        with self._read_lock, self._get_read_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT subject, difficulty, question_type, rowid FROM questions")
+            for subject, difficulty, question_type, rowid in cursor.fetchall():
+                index.setdefault((subject, difficulty, question_type), []).append(rowid)
+        return index
+
+    def _rowids_for(self,
+                    subject: Optional[str] = None,
+                    difficulty: Optional[str] = None,
+                    question_type: Optional[str] = None) -> List[int]:
+        """Rowids matching a filter combination, memoized per combination"""
+        wanted = (subject, difficulty, question_type)
+
+        def collect() -> List[int]:
+            index = self._cached("rowid_index", self._build_rowid_index)
+            rowids: List[int] = []
+            for key, ids in index.items():
+                if all(not w or w == "All" or w == k for w, k in zip(wanted, key)):
+                    rowids.extend(ids)
+            return rowids
+
+        return self._cached(("rowids", *wanted), collect)
+
+    def _fetch_random(self, num_questions: int, columns: Tuple[str, ...],
+                      subject: Optional[str], difficulty: Optional[str],
+                      question_type: Optional[str]) -> List[Tuple]:
+        """Sample rowids from the in-memory index, then fetch the picks by rowid"""
+        rowids = self._rowids_for(subject, difficulty, question_type)
+        if not rowids or num_questions <= 0:
+            return []
+        picks = random.sample(rowids, min(num_questions, len(rowids)))
+        placeholders, params = _padded_in_list(picks)
+        query = f"{_select_questions_sql(columns)} AND rowid IN ({placeholders})"
+
+        with self._read_lock, self._get_read_conn() as conn:
             cursor = conn.cursor()
             cursor.execute(query, params)
             rows = cursor.fetchall()
-            
-            return [dict(row) for row in rows]
+
+        # IN returns rows in rowid order
+        random.shuffle(rows)
+        return rows
+
+    def get_random_questions(self, num_questions: int = 5, 
+                           subject: Optional[str] = None, 
+                           difficulty: Optional[str] = None,
+                           question_type: Optional[str] = None,
+                           columns: Tuple[str, ...] = DEFAULT_QUESTION_FIELDS) -> List[Dict]:
+        """Get random questions with optional filtering, projected to `columns`"""
+        rows = self._fetch_random(num_questions, columns, subject, difficulty, question_type)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def get_random_question_ids(self, num_questions: int = 5,
+                                subject: Optional[str] = None,
+                                difficulty: Optional[str] = None,
+                                question_type: Optional[str] = None) -> List[str]:
+        """Get random question IDs only (first stage of two-stage sampling)"""
+        rows = self._fetch_random(num_questions, ("id",), subject, difficulty, question_type)
+        return [row[0] for row in rows]
 
     def get_adaptive_question(self,
                               exclude_ids: Optional[List[str]] = None,
                               subject: Optional[str] = None,
                               difficulty: Optional[str] = None,
                               question_type: Optional[str] = None,
-                              difficulty_bin: Optional[str] = None) -> Optional[Dict]:
+                              difficulty_bin: Optional[str] = None,
+                              columns: Tuple[str, ...] = DEFAULT_QUESTION_FIELDS) -> Optional[Dict]:
         """
         Select a single question while excluding a provided set of IDs and optionally
         steering toward a target difficulty bin using a proxy based on question length.
 
         difficulty_bin values: 'easy' (short), 'medium' (mid), 'hard' (long).
+        `columns` picks the returned fields; `id` is always included.
         """
-        base_query = ["SELECT * FROM questions WHERE 1=1"]
-        params: List = []
-
-        if subject and subject != "All":
-            base_query.append("AND subject = ?")
-            params.append(subject)
+        if "id" not in columns:
+            columns = ("id", *columns)
+        id_pos = columns.index("id")
+        select_sql = _select_questions_sql(columns)
+        filter_key = (subject, difficulty, question_type, difficulty_bin)
+        count = self._count_cached(filter_key)
+        if count == 0:
+            return None
+        clauses, params = self._filter_clauses(*filter_key)
+        excluded = set(exclude_ids or ())
 
-        # The dataset's difficulty is mostly 'Intermediate'; keep for forward-compat
-        if difficulty and difficulty != "All":
-            base_query.append("AND difficulty = ?")
-            params.append(difficulty)
-
-        if question_type and question_type != "All":
-            base_query.append("AND question_type = ?")
-            params.append(question_type)
+        with self._read_lock, self._get_read_conn() as conn:
+            cursor = conn.cursor()
 
-        # Exclude already served question IDs
-        if exclude_ids:
-            # Build placeholders (?, ?, ...)
-            placeholders = ",".join(["?"] * len(exclude_ids))
-            base_query.append(f"AND id NOT IN ({placeholders})")
-            params.extend(exclude_ids)
-
-        # Apply length-based difficulty proxy if requested
-        # easy: LENGTH(question) < 120
-        # medium: 120 <= LENGTH(question) <= 240
-        # hard: LENGTH(question) > 240
-        if difficulty_bin == "easy":
-            base_query.append("AND LENGTH(question) < 120")
-        elif difficulty_bin == "medium":
-            base_query.append("AND LENGTH(question) BETWEEN 120 AND 240")
-        elif difficulty_bin == "hard":
-            base_query.append("AND LENGTH(question) > 240")
+            # Random offset picks; retry when a pick lands on an already served ID
+            pick_query = " ".join([select_sql, *clauses, "LIMIT 1 OFFSET ?"])
+            for offset in random.sample(range(count), min(count, ADAPTIVE_MAX_PICKS)):
+                cursor.execute(pick_query, [*params, offset])
+                row = cursor.fetchone()
+                if row is not None and row[id_pos] not in excluded:
+                    return dict(zip(columns, row))
 
-        base_query.append("ORDER BY RANDOM() LIMIT 1")
-        query = " ".join(base_query)
+        if not excluded:
+            return None
 
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        # Most of the pool has been served: exclude in SQL instead. The IDs go
+        # into a temp table so exclusion is a primary-key probe per row rather
+        # than a scan of a long NOT IN list. Temp tables need the writable
+        # connection (the reader runs with query_only).
+        with self._lock, self._get_conn() as conn:
             cursor = conn.cursor()
+            cursor.execute("CREATE TEMP TABLE IF NOT EXISTS served_ids (id TEXT PRIMARY KEY)")
+            cursor.execute("DELETE FROM temp.served_ids")
+            cursor.executemany("INSERT OR IGNORE INTO temp.served_ids (id) VALUES (?)",
+                               ((qid,) for qid in excluded))
+            query = " ".join([
+                select_sql,
+                *clauses,
+                "AND NOT EXISTS (SELECT 1 FROM temp.served_ids s WHERE s.id = questions.id)",
+                "ORDER BY RANDOM() LIMIT 1",
+            ])
             cursor.execute(query, params)
             row = cursor.fetchone()
             return dict(row) if row else None
     
+    def _compute_facets(self) -> Dict[str, List[str]]:
+        """Collect the four distinct-value lists in one table scan"""
+        facets: Dict[str, set] = {
+            "subjects": set(), "difficulties": set(), "question_types": set(), "raw_subjects": set()
+        }
+        with self._read_lock, self._get_read_conn() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT subject, difficulty, question_type, raw_subject FROM questions")
+            for subject, difficulty, question_type, raw_subject in cursor.fetchall():
+                facets["subjects"].add(subject)
+                facets["difficulties"].add(difficulty)
+                facets["question_types"].add(question_type)
+                if raw_subject:
+                    facets["raw_subjects"].add(raw_subject)
+
+        # Match SQLite's ORDER BY: NULLs first, then binary (code point) order
+        return {
+            name: sorted(values, key=lambda v: (v is not None, v or ""))
+            for name, values in facets.items()
+        }
+
+    def _read_data_version(self) -> int:
+        """PRAGMA data_version on the reader; changes whenever any other connection commits"""
+        with self._read_lock:
+            return self._get_read_conn().execute("PRAGMA data_version").fetchone()[0]
+
+    def _sync_caches(self):
+        """Drop cached results if another connection has written to the database"""
+        data_version = self._read_data_version()
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self._meta_cache.clear()
+            self._count_cache.clear()
+
+    def _adopt_own_write(self, version_before: int):
+        """
+        Keep the caches after this manager's own user_results commit.
+
+        The commit bumps data_version although no question changed. If the caches
+        were current just before it, record the new version so they survive.
+        """
+        with self._cache_lock:
+            if self._data_version == version_before:
+                self._data_version = self._read_data_version()
+
+    def _invalidate_caches(self):
+        """Drop cached metadata/counts after this manager writes questions"""
+        with self._cache_lock:
+            self._meta_cache.clear()
+            self._count_cache.clear()
+
+    def _cached(self, key, compute, *args):
+        """Return the memoized result of compute(*args) until the data changes"""
+        with self._cache_lock:
+            self._sync_caches()
+            if key in self._meta_cache:
+                return self._meta_cache[key]
+            version = self._data_version
+        # Computed on the reader connection without holding any cache/writer lock, so a
+        # concurrent ingest or save_user_result never blocks it (and nested _cached calls are fine)
+        value = compute(*args)
+        with self._cache_lock:
+            # Don't store a result computed against data that has since changed
+            if self._data_version == version:
+                value = self._meta_cache.setdefault(key, value)
+        return value
+
+    def get_facets(self) -> Dict[str, List[str]]:
+        """Get subjects, difficulties, question types and raw subjects together"""
+        facets = self._cached("facets", self._compute_facets)
+        return {name: list(values) for name, values in facets.items()}
+
     def get_subjects(self) -> List[str]:
         """Get list of available subjects"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT subject FROM questions ORDER BY subject")
-            return [row[0] for row in cursor.fetchall()]
+        return list(self._cached("facets", self._compute_facets)["subjects"])
     
     def get_difficulties(self) -> List[str]:
         """Get list of available difficulties"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT difficulty FROM questions ORDER BY difficulty")
-            return [row[0] for row in cursor.fetchall()]
+        return list(self._cached("facets", self._compute_facets)["difficulties"])
     
     def get_question_types(self) -> List[str]:
         """Get list of available question types"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT question_type FROM questions ORDER BY question_type")
-            return [row[0] for row in cursor.fetchall()]
+        return list(self._cached("facets", self._compute_facets)["question_types"])
     
     def get_raw_subjects(self) -> List[str]:
         """Get list of available raw subjects"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT raw_subject FROM questions WHERE raw_subject != '' ORDER BY raw_subject")
-            return [row[0] for row in cursor.fetchall()]
+        return list(self._cached("facets", self._compute_facets)["raw_subjects"])
     
     def get_stats(self) -> Dict:
         """Get comprehensive database statistics"""
-        with sqlite3.connect(self.db_path) as conn:
+        # Deep copy: the nested lists/dicts are shared with the cache and callers may mutate them
+        return copy.deepcopy(self._cached("stats", self._compute_stats))
+
+    def _compute_stats(self) -> Dict:
+        """Compute get_stats with a single UNION ALL query (one GROUP BY per dimension)"""
+        with self._read_lock, self._get_read_conn() as conn:
             cursor = conn.cursor()
-            
-            # Total questions
-            cursor.execute("SELECT COUNT(*) FROM questions")
-            total_questions = cursor.fetchone()[0]
-            
-            # Subject counts
-            cursor.execute("""
-                SELECT subject, COUNT(*) as count 
-                FROM questions 
-                GROUP BY subject 
-                ORDER BY count DESC
-            """)
-            subject_counts = dict(cursor.fetchall())
-            
-            # Difficulty counts
-            cursor.execute("""
-                SELECT difficulty, COUNT(*) as count 
-                FROM questions 
-                GROUP BY difficulty 
-                ORDER BY count DESC
-            """)
-            difficulty_counts = dict(cursor.fetchall())
-            
-            # Question type counts
-            cursor.execute("""
-                SELECT question_type, COUNT(*) as count 
-                FROM questions 
-                GROUP BY question_type 
-                ORDER BY count DESC
-            """)
-            question_type_counts = dict(cursor.fetchall())
-            
-            # Raw subject counts (top 20)
-            cursor.execute("""
-                SELECT raw_subject, COUNT(*) as count 
-                FROM questions 
-                WHERE raw_subject != ''
-                GROUP BY raw_subject 
-                ORDER BY count DESC 
-                LIMIT 20
-            """)
-            raw_subject_counts = dict(cursor.fetchall())
-            
-            return {
-                "total_questions": total_questions,
-                "subjects": list(subject_counts.keys()),
-                "difficulties": list(difficulty_counts.keys()),
-                "question_types": list(question_type_counts.keys()),
-                "raw_subjects": list(raw_subject_counts.keys()),
-                "subject_counts": subject_counts,
-                "difficulty_counts": difficulty_counts,
-                "question_type_counts": question_type_counts,
-                "raw_subject_counts": raw_subject_counts
-            }
+            cursor.execute(SUMMARY_COUNTS_SQL)
+            rows = cursor.fetchall()
+
+        total_questions = 0
+        buckets: Dict[str, List[Tuple]] = {
+            "subject": [], "difficulty": [], "question_type": [], "raw_subject": []
+        }
+        for bucket, key, count in rows:
+            if bucket == "total":
+                total_questions = count
+            else:
+                buckets[bucket].append((key, count))
+
+        def by_count(pairs: List[Tuple]) -> Dict:
+            return dict(sorted(pairs, key=lambda pair: pair[1], reverse=True))
+
+        subject_counts = by_count(buckets["subject"])
+        difficulty_counts = by_count(buckets["difficulty"])
+        question_type_counts = by_count(buckets["question_type"])
+        # Raw subject counts (top 20)
+        raw_subject_counts = dict(list(by_count(buckets["raw_subject"]).items())[:20])
+
+        return {
+            "total_questions": total_questions,
+            "subjects": list(subject_counts.keys()),
+            "difficulties": list(difficulty_counts.keys()),
+            "question_types": list(question_type_counts.keys()),
+            "raw_subjects": list(raw_subject_counts.keys()),
+            "subject_counts": subject_counts,
+            "difficulty_counts": difficulty_counts,
+            "question_type_counts": question_type_counts,
+            "raw_subject_counts": raw_subject_counts
+        }
     
     def save_user_result(self, user_id: str, result: Dict) -> int:
         """Save user quiz result to database"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._lock, self._get_conn() as conn:
+            # data_version covers the whole file, so note it to tell this write from question writes
+            version_before = self._read_data_version()
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -291,16 +693,16 @@ class DatabaseManager:
                 result.get('accuracy_percentage', 0),
                 result.get('subject', 'All'),
                 result.get('difficulty', 'All'),
-                json.dumps(result.get('detailed_results', []))
+                _json_dumps(result.get('detailed_results', []))
             ))
             
             conn.commit()
+            self._adopt_own_write(version_before)
             return cursor.lastrowid
     
     def get_user_results(self, user_id: str, limit: int = 50) -> List[Dict]:
         """Get user's quiz results"""
-        with sqlite3.connect(self.db_path) as conn:
-            conn.row_factory = sqlite3.Row
+        with self._read_lock, self._get_read_conn() as conn:
             cursor = conn.cursor()
             
             cursor.execute("""
@@ -310,18 +712,31 @@ class DatabaseManager:
                 LIMIT ?
             """, (user_id, limit))
             
-            rows = cursor.fetchall()
-            results = []
-            for row in rows:
-                result = dict(row)
-                result['detailed_results'] = json.loads(result['detailed_results'])
-                results.append(result)
+            results = _rows_as_dicts(cursor)
+            for result in results:
+                result['detailed_results'] = _json_loads(result['detailed_results'])
             
             return results
+
+    def get_user_results_summary(self, user_id: str, limit: int = 50) -> List[Dict]:
+        """Get user's quiz results without the detailed_results payload (list views)"""
+        with self._read_lock, self._get_read_conn() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute("""
+                SELECT id, user_id, timestamp, duration_seconds, total_questions,
+                       correct_answers, accuracy_percentage, subject, difficulty
+                FROM user_results 
+                WHERE user_id = ? 
+                ORDER BY timestamp DESC 
+                LIMIT ?
+            """, (user_id, limit))
+            
+            return _rows_as_dicts(cursor)
     
     def get_analytics(self) -> Dict:
         """Get comprehensive analytics data"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._read_lock, self._get_read_conn() as conn:
             cursor = conn.cursor()
             
             # Total results
@@ -364,11 +779,13 @@ class DatabaseManager:
     
     def clear_database(self):
         """Clear all data from database"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._lock, self._get_conn() as conn:
             cursor = conn.cursor()
             cursor.execute("DELETE FROM questions")
             cursor.execute("DELETE FROM user_results")
+            self._refresh_summary_counts(cursor)
             conn.commit()
+        self._invalidate_caches()
     
     def get_database_size(self) -> str:
         """Get database file size"""
@@ -4,12 +4,20 @@ HLE Database Loader
 Integrates HLE dataset with SQLite database for efficient storage and retrieval.
 """
 
+import io
 import os
 import requests
-import pandas as pd
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+try:
+    import pandas as pd  # optional; speeds up row conversion during ingest
+except Exception:
+    pd = None
 from core.database_manager import DatabaseManager
 
+# Parallel downloads when streaming the dataset's parquet shards
+SHARD_WORKERS = 4
+
 class HLEDatabaseLoader:
     def __init__(self, db_path: str = "data/hle_quiz.db"):
         self.db_manager = DatabaseManager(db_path)
@@ -27,31 +35,11 @@ class HLEDatabaseLoader:
             
             print("📥 Loading HLE dataset into database...")
             
-            # Use Hugging Face datasets library
-            from datasets import load_dataset
-            
-            # Load the dataset
-            dataset = load_dataset("cais/hle", split="test")
-            print(f"📊 Loaded {len(dataset)} questions from HLE dataset")
-            
-            # Convert to question format
-            questions = []
-            for item in dataset:
-                question = {
-                    'id': str(item.get('id', '')),
-                    'question': str(item.get('question', '')),
-                    'answer': str(item.get('answer', '')),
-                    'subject': str(item.get('category', 'Other')),
-                    'raw_subject': str(item.get('raw_subject', '')),
-                    'difficulty': 'Intermediate',  # HLE dataset doesn't have difficulty
-                    'explanation': str(item.get('rationale', 'No explanation available.')),
-                    'question_type': 'text',
-                    'image': str(item.get('image', ''))
-                }
-                questions.append(question)
-            
-            # Insert into database
-            inserted = self.db_manager.insert_questions(questions)
+            try:
+                inserted = self._load_parquet_shards()
+            except Exception as e:
+                print(f"⚠️  Parquet shard download failed ({e}); falling back to datasets library")
+                inserted = self._load_with_datasets()
             print(f"✅ Inserted {inserted} questions into database")
             
             print(f"🎉 Successfully loaded {inserted} questions into database")
@@ -61,6 +49,100 @@ class HLEDatabaseLoader:
             print(f"❌ Error loading dataset: {e}")
             return False
     
+    def _hf_headers(self) -> Dict[str, str]:
+        """Authorization header from HF_TOKEN, if set"""
+        token = os.environ.get("HF_TOKEN")
+        return {"Authorization": f"Bearer {token}"} if token else {}
+
+    def _load_parquet_shards(self) -> int:
+        """
+        Stream the dataset's parquet shards straight into the database.
+
+        Shards download in parallel while already-finished shards are inserted,
+        so ingest time tracks max(network, insert) rather than their sum.
+        """
+        response = requests.get(self.dataset_url, headers=self._hf_headers(), timeout=30)
+        response.raise_for_status()
+        urls = response.json()
+        if not urls:
+            raise RuntimeError("no parquet shards listed")
+        print(f"📊 Streaming {len(urls)} parquet shard(s) from HLE dataset")
+        return self.db_manager.insert_question_rows(self._iter_shard_rows(urls))
+
+    def _fetch_shard(self, url: str):
+        """Download one parquet shard into a pyarrow Table"""
+        import pyarrow.parquet as pq  # installed with the datasets library
+
+        response = requests.get(url, headers=self._hf_headers(), timeout=120)
+        response.raise_for_status()
+        return pq.read_table(io.BytesIO(response.content))
+
+    def _iter_shard_rows(self, urls: List[str]) -> Iterator[Tuple]:
+        """Yield question tuples from each shard as soon as its download completes"""
+        with ThreadPoolExecutor(max_workers=SHARD_WORKERS) as executor:
+            futures = [executor.submit(self._fetch_shard, url) for url in urls]
+            for future in as_completed(futures):
+                table = future.result()
+                yield from self._dataset_rows(table if pd is not None else table.to_pylist())
+
+    def _load_with_datasets(self) -> int:
+        """Load through the Hugging Face datasets library (downloads the whole split first)"""
+        from datasets import load_dataset
+        
+        dataset = load_dataset("cais/hle", split="test")
+        print(f"📊 Loaded {len(dataset)} questions from HLE dataset")
+        
+        # Convert to question rows and bulk insert into database
+        return self.db_manager.insert_question_rows(self._dataset_rows(dataset))
+
+    def _dataset_rows(self, dataset):
+        """
+        Convert HLE records into question tuples (QUESTION_COLUMNS order).
+
+        Uses vectorized pandas column ops when available, otherwise streams the
+        records through a generator.
+        """
+        if pd is None:
+            return self._iter_dataset_rows(dataset)
+
+        df = dataset.to_pandas()
+
+        def column(name: str, default: str):
+            if name not in df.columns:
+                return pd.Series(default, index=df.index, dtype=object)
+            return df[name].fillna(default).astype(str)
+
+        out = pd.DataFrame({
+            'id': column('id', ''),
+            'question': column('question', ''),
+            'answer': column('answer', ''),
+            'subject': column('category', 'Other'),
+            'raw_subject': column('raw_subject', ''),
+            'difficulty': 'Intermediate',  # HLE dataset doesn't have difficulty
+            'explanation': column('rationale', 'No explanation available.'),
+            'question_type': 'text',
+            'image': column('image', ''),
+        })
+        out['question_length'] = out['question'].str.len()
+        return list(out.itertuples(index=False, name=None))
+
+    def _iter_dataset_rows(self, dataset) -> Iterator[Tuple]:
+        """Row-by-row fallback for _dataset_rows when pandas is unavailable"""
+        for item in dataset:
+            question = str(item.get('question', ''))
+            yield (
+                str(item.get('id', '')),
+                question,
+                str(item.get('answer', '')),
+                str(item.get('category', 'Other')),
+                str(item.get('raw_subject', '')),
+                'Intermediate',  # HLE dataset doesn't have difficulty
+                str(item.get('rationale', 'No explanation available.')),
+                'text',
+                str(item.get('image', '')),
+                len(question),
+            )
+
     def get_random_questions(self, num_questions: int = 5, 
                            subject: Optional[str] = None, 
                            difficulty: Optional[str] = None,
@@ -68,6 +150,10 @@ class HLEDatabaseLoader:
         """Get random questions from database"""
         return self.db_manager.get_random_questions(num_questions, subject, difficulty, question_type)
     
+    def get_facets(self) -> Dict[str, List[str]]:
+        """Get subjects, difficulties, question types and raw subjects in one call"""
+        return self.db_manager.get_facets()
+    
     def get_subjects(self) -> List[str]:
         """Get available subjects from database"""
         return self.db_manager.get_subjects()
@@ -95,6 +181,10 @@ class HLEDatabaseLoader:
     def get_user_results(self, user_id: str, limit: int = 50) -> List[Dict]:
         """Get user's quiz results"""
         return self.db_manager.get_user_results(user_id, limit)
+
+    def get_user_results_summary(self, user_id: str, limit: int = 50) -> List[Dict]:
+        """Get user's quiz results without per-question details"""
+        return self.db_manager.get_user_results_summary(user_id, limit)
     
     def get_analytics(self) -> Dict:
         """Get comprehensive analytics"""
@@ -6,7 +6,31 @@ Setup script for Hugging Face token and HLE dataset access
 import os
 import requests
 import json
+from functools import lru_cache
 from getpass import getpass
+from requests.adapters import HTTPAdapter
+
+# Shared session so the whoami and dataset checks reuse one TLS connection
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
+def _auth_headers(token):
+    """Build Hugging Face API request headers"""
+    return {
+        "Authorization": f"Bearer {token}",
+        "Content-Type": "application/json"
+    }
+
+@lru_cache(maxsize=1)
+def _whoami(token):
+    """Return (status_code, user_info) for a token; cached for the process lifetime"""
+    response = _SESSION.get(
+        "https://huggingface.co/api/whoami",
+        headers=_auth_headers(token),
+        timeout=10
+    )
+    user_info = response.json() if response.status_code == 200 else None
+    return response.status_code, user_info
 
 def setup_hf_token():
     """Set up Hugging Face token"""
@@ -50,25 +74,15 @@ def setup_hf_token():
 
 def test_hf_token(token):
     """Test if the HF token is valid"""
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
-    
     # Test with a simple API call
     try:
-        response = requests.get(
-            "https://huggingface.co/api/whoami",
-            headers=headers,
-            timeout=10
-        )
+        status_code, user_info = _whoami(token.strip())
         
-        if response.status_code == 200:
-            user_info = response.json()
+        if status_code == 200:
             print(f"✅ Authenticated as: {user_info.get('name', 'Unknown')}")
             return True
         else:
-            print(f"❌ Authentication failed: {response.status_code}")
+            print(f"❌ Authentication failed: {status_code}")
             return False
             
     except Exception as e:
@@ -95,16 +109,13 @@ def test_hle_access(token):
     print("\n🔍 Testing HLE Dataset Access")
     print("=" * 40)
     
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json"
-    }
+    headers = _auth_headers(token)
     
     # Try to access HLE dataset
     url = "https://datasets-server.huggingface.co/first-rows?dataset=cais%2Fhle&config=default&split=test"
     
     try:
-        response = requests.get(url, headers=headers, timeout=30)
+        response = _SESSION.get(url, headers=headers, timeout=30)
         
         if response.status_code == 200:
             data = response.json()
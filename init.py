@@ -26,6 +26,7 @@ from __future__ import annotations
 import argparse
 import os
 import platform
+import re
 import shutil
 import secrets
 import subprocess
@@ -44,6 +45,19 @@ def venv_python(venv_dir: Path) -> Path:
     return venv_dir / "bin" / "python"
 
 
+def venv_env(venv_dir: Path) -> dict[str, str]:
+    env = os.environ.copy()
+    env["VIRTUAL_ENV"] = str(venv_dir)
+    bin_dir = venv_python(venv_dir).parent  # Scripts on Windows, bin elsewhere
+    env["PATH"] = str(bin_dir) + os.pathsep + env.get("PATH", "")
+    return env
+
+
+def setup_env(venv_dir: Path, extra: str, root: Path) -> None:
+    # Install from root via extras to keep dependencies centralized
+    run(["uv", "pip", "install", "-e", f".[{extra}]"], cwd=root, env=venv_env(venv_dir))
+
+
 def ensure_uv_installed() -> None:
     if shutil.which("uv") is None:
         raise RuntimeError(
@@ -51,21 +65,15 @@ def ensure_uv_installed() -> None:
         )
 
 
+# KEY=VALUE lines; comments (#...), blank lines and lines without '=' never match
+_ENV_RE = re.compile(r"^[^\S\n]*([^#=\s][^=\n]*?)[^\S\n]*=[^\S\n]*(.*?)[^\S\n]*$", re.M)
+
+
 def _read_env_file(env_path: Path) -> dict[str, str]:
     if not env_path.exists():
         return {}
-    result: dict[str, str] = {}
-    for line in env_path.read_text(encoding="utf-8").splitlines():
-        line = line.strip()
-        if not line or line.startswith("#"):
-            continue
-        if "=" not in line:
-            continue
-        key, value = line.split("=", 1)
-        key = key.strip()
-        value = value.strip().strip('"').strip("'")
-        result[key] = value
-    return result
+    text = env_path.read_text(encoding="utf-8")
+    return {key: value.strip('"').strip("'") for key, value in _ENV_RE.findall(text)}
 
 
 def write_env_file(env_path: Path, auth_token: str | None, my_number: str | None, db_path: Path | None) -> None:
@@ -130,18 +138,21 @@ def main() -> None:
     base_python = sys.executable
     print(f"Using base python: {base_python}")
 
-    # 1) Prepare HLE venv and ingest DB
+    # 1) Prepare both venvs
     ensure_uv_installed()
-    # Create venvs with uv (idempotent)
-    if not hle_venv.exists():
-        run(["uv", "venv"], cwd=hle_dir)
+    # Create venvs with uv (idempotent); sequentially to avoid racing on uv's cache
+    for venv_dir in (hle_venv, server_venv):
+        if not venv_dir.exists():
+            run(["uv", "venv"], cwd=venv_dir.parent)
     hle_py = venv_python(hle_venv)
-    # Prefer installing from root via extras to keep dependencies centralized
-    hle_env = os.environ.copy()
-    hle_env["VIRTUAL_ENV"] = str(hle_venv)
-    hle_env["PATH"] = str(hle_venv / "bin") + os.pathsep + hle_env.get("PATH", "")
-    run(["uv", "pip", "install", "-e", ".[pipeline]"], cwd=root, env=hle_env)
+    server_py = venv_python(server_venv)
+    # Install sequentially: both are editable installs of the same root, so running
+    # them concurrently would race on the egg-info/build metadata written there.
+    # uv's cache keeps the second install fast anyway.
+    for venv_dir, extra in ((hle_venv, "pipeline"), (server_venv, "server")):
+        setup_env(venv_dir, extra, root)
 
+    # 2) Ingest DB
     ingest_env = os.environ.copy()
     if args.hf_token:
         ingest_env["HF_TOKEN"] = args.hf_token
@@ -154,15 +165,7 @@ def main() -> None:
         init_db_cmd.append("--force")
     run(init_db_cmd, cwd=hle_dir, env=ingest_env)
 
-    # 2) Prepare MCP server venv and .env
-    if not server_venv.exists():
-        run(["uv", "venv"], cwd=server_dir)
-    server_py = venv_python(server_venv)
-    server_env = os.environ.copy()
-    server_env["VIRTUAL_ENV"] = str(server_venv)
-    server_env["PATH"] = str(server_venv / "bin") + os.pathsep + server_env.get("PATH", "")
-    run(["uv", "pip", "install", "-e", ".[server]"], cwd=root, env=server_env)
-
+    # 3) Prepare MCP server .env
     # Preserve existing .env values unless explicitly overridden via flags/env
     existing = _read_env_file(server_env)
     auth_token = args.auth_token or existing.get("AUTH_TOKEN") or secrets.token_hex(16)
@@ -183,7 +186,15 @@ def main() -> None:
 
     if args.start_server:
         print("\nStarting MCP server...")
-        run([str(server_py), str(server_dir / "mcp_hle_server.py")], cwd=server_dir)
+        server_cmd = [str(server_py), str(server_dir / "mcp_hle_server.py")]
+        if platform.system().lower().startswith("win"):
+            run(server_cmd, cwd=server_dir)
+        else:
+            # Replace this process rather than keeping a parent interpreter waiting on the server
+            print(f"$ {' '.join(server_cmd)}")
+            sys.stdout.flush()
+            os.chdir(server_dir)
+            os.execv(server_cmd[0], server_cmd)
 
 
 if __name__ == "__main__":
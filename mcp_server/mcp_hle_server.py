@@ -1,17 +1,33 @@
 import asyncio
+import atexit
+import functools
+import itertools
 import os
+import pathlib
+import queue
+import random
+import re
 import sqlite3
 import textwrap
-from dataclasses import dataclass
-from typing import Annotated, Optional, List, Dict
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Annotated, Iterator, Optional, List, Dict
 
 from dotenv import load_dotenv
 from fastmcp import FastMCP
-from fastmcp.server.auth.providers.bearer import BearerAuthProvider, RSAKeyPair
+from fastmcp.server.auth.providers.bearer import BearerAuthProvider
 from mcp.server.auth.provider import AccessToken
 from mcp.types import INVALID_PARAMS
 from mcp import ErrorData, McpError
-from pydantic import BaseModel, Field
+from pydantic import Field
+try:
+    from rapidfuzz import fuzz  # optional; tolerant answer matching
+except Exception:
+    fuzz = None
 
 # Load env
 load_dotenv()
@@ -30,10 +46,14 @@ if not AUTH_TOKEN:
     print("[WARN] AUTH_TOKEN not set; using insecure test token 'dev'.")
     AUTH_TOKEN = "dev"
 
+# Never used: load_access_token below replaces JWT verification with a static-token compare.
+# The base class just requires *some* public key, so don't generate an RSA pair at import.
+_UNUSED_PUBLIC_KEY = "-----BEGIN PUBLIC KEY-----\nunused\n-----END PUBLIC KEY-----\n"
+
+
 class SimpleBearerAuthProvider(BearerAuthProvider):
     def __init__(self, token: str):
-        k = RSAKeyPair.generate()
-        super().__init__(public_key=k.public_key, jwks_uri=None, issuer=None, audience=None)
+        super().__init__(public_key=_UNUSED_PUBLIC_KEY, jwks_uri=None, issuer=None, audience=None)
         self.token = token
 
     async def load_access_token(self, token: str) -> AccessToken | None:
@@ -48,14 +68,226 @@ mcp = FastMCP(
 
 # DB helpers
 
-def get_conn() -> sqlite3.Connection:
+# Per-connection tuning; WAL itself is persisted in the DB file by _init_db()
+CONNECTION_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-64000",
+    "PRAGMA mmap_size=268435456",
+    # Wait out an ingest's write lock instead of failing with "database is locked"
+    "PRAGMA busy_timeout=5000",
+)
+
+# Read-only connections shared by all tool calls; worker threads each check one out,
+# so queries from concurrent tool calls no longer serialize on a single connection
+POOL_SIZE = 4
+_POOL: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()  # LIFO: reuse the warmest one
+_POOL_CONNS: List[sqlite3.Connection] = []
+_POOL_LOCK = threading.Lock()
+# PRAGMA data_version is per-connection, so cache keys always come from this one
+_VERSION_CONN: Optional[sqlite3.Connection] = None
+_VERSION_LOCK = threading.Lock()
+
+
+def _open_conn() -> sqlite3.Connection:
+    # Checked only while connections are being opened; afterwards it is pure stat() overhead
     if not os.path.exists(DB_PATH):
         raise McpError(ErrorData(code=INVALID_PARAMS, message=f"DB not found at {DB_PATH}. Run scripts/init_db.py first."))
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
+    # Read-only: the server never writes questions. Deliberately not immutable=1,
+    # since init_db.py may reload the DB while the server runs and readers must
+    # see that (and PRAGMA data_version must keep changing for the caches).
+    conn = sqlite3.connect(
+        pathlib.Path(DB_PATH).absolute().as_uri() + "?mode=ro",
+        uri=True, check_same_thread=False, isolation_level=None, cached_statements=512,
+    )
+    # No row_factory: every query here unpacks its fixed column list by position
+    _apply_pragmas(conn)
     return conn
 
-class Question(BaseModel):
+
+def _checkout() -> sqlite3.Connection:
+    try:
+        return _POOL.get_nowait()
+    except queue.Empty:
+        pass
+    with _POOL_LOCK:
+        if len(_POOL_CONNS) < POOL_SIZE:
+            conn = _open_conn()
+            _POOL_CONNS.append(conn)
+            return conn
+    return _POOL.get()
+
+
+@contextmanager
+def get_conn() -> Iterator[sqlite3.Connection]:
+    conn = _checkout()
+    try:
+        yield conn
+    finally:
+        _POOL.put(conn)
+
+
+@atexit.register
+def _close_conns() -> None:
+    global _VERSION_CONN
+    with _POOL_LOCK:
+        for conn in _POOL_CONNS:
+            conn.close()
+        _POOL_CONNS.clear()
+        while not _POOL.empty():
+            _POOL.get_nowait()
+    with _VERSION_LOCK:
+        if _VERSION_CONN is not None:
+            _VERSION_CONN.close()
+            _VERSION_CONN = None
+
+
+# Typo tolerance for word answers only: whole-string similarity, long answers, no digits.
+# HLE answers are exact, so a near-miss number ("2.7182" vs "2.7183") or a one-token
+# difference in a short answer must never pass.
+FUZZY_MIN_LENGTH = 8
+FUZZY_MIN_SCORE = 95
+_DIGIT = re.compile(r"\d")
+
+
+@functools.lru_cache(maxsize=4096)
+def _norm(text: str) -> str:
+    """Casefold, strip diacritics and collapse whitespace; operators, brackets and punctuation are kept."""
+    # NFD, not NFKD: compatibility folding would turn "x²" into "x2"
+    decomposed = unicodedata.normalize("NFD", text.casefold())
+    without_marks = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(without_marks.split())
+
+
+def _fold(text: Optional[str]) -> str:
+    """Stripped and casefolded, the form both sides of an answer comparison are kept in."""
+    return (text or "").strip().casefold()
+
+
+def _overlaps(a: str, b: str) -> bool:
+    """a == b, or either contains the other; only the shorter can occur in the longer, so at most one scan."""
+    la, lb = len(a), len(b)
+    if la == lb:
+        return a == b
+    return a in b if la < lb else b in a
+
+
+def _answer_matches(answer_norm: str, gt: str) -> bool:
+    """Lenient match of two _fold()ed strings: equal, or either contains the other."""
+    if _overlaps(answer_norm, gt):
+        return True
+    # Retry ignoring diacritics and spacing (math symbols are significant: "x+1" != "x-1")
+    user_n, gt_n = _norm(answer_norm), _norm(gt)
+    if not user_n or not gt_n:
+        return False
+    if _overlaps(user_n, gt_n):
+        return True
+    if (
+        fuzz is None
+        or min(len(user_n), len(gt_n)) < FUZZY_MIN_LENGTH
+        or _DIGIT.search(user_n)
+        or _DIGIT.search(gt_n)
+    ):
+        return False
+    return fuzz.ratio(user_n, gt_n) >= FUZZY_MIN_SCORE
+
+
+def _apply_pragmas(conn: sqlite3.Connection) -> None:
+    for pragma in CONNECTION_PRAGMAS:
+        try:
+            conn.execute(pragma)
+        except sqlite3.Error as e:
+            # e.g. mmap unavailable on this platform; the defaults still work
+            print(f"[WARN] {pragma} failed: {e}")
+
+
+# (name, target) of the indexes behind the exam and quiz filters; idx_qlen_bin matches the pipeline's
+SERVER_INDEXES = (
+    ("idx_q_subject_qtype", "questions(subject, question_type)"),
+    ("idx_qlen_bin", "questions(question_length)"),
+)
+
+
+def _init_db() -> None:
+    """Startup setup: WAL journaling, the filter indexes and planner statistics."""
+    if not os.path.exists(DB_PATH):
+        print(f"[WARN] DB not found at {DB_PATH}; run scripts/init_db.py first.")
+        return
+    # One-shot read-write connection; tool calls use the shared read-only one
+    conn = sqlite3.connect(DB_PATH, isolation_level=None)
+    try:
+        # WAL creates hle_quiz.db-wal / hle_quiz.db-shm next to the DB while the server runs
+        conn.execute("PRAGMA journal_mode=WAL")
+        # `id` is the PRIMARY KEY, so lookups by id already use its unique index; a covering
+        # (id, answer, explanation) index would duplicate the largest columns for no gain
+        # The quiz level filters use the stored question_length; backfill it for DBs ingested before it existed
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(questions)")}
+        if "question_length" not in columns:
+            conn.execute("BEGIN")
+            conn.execute("ALTER TABLE questions ADD COLUMN question_length INTEGER")
+            conn.execute("UPDATE questions SET question_length = LENGTH(question)")
+            conn.execute("COMMIT")
+        for name, target in SERVER_INDEXES:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target}")
+        # Planner statistics, if the ingest did not leave any (older DBs) or predate the indexes above
+        try:
+            analyzed = conn.execute(
+                f"SELECT COUNT(DISTINCT idx) FROM sqlite_stat1 WHERE idx IN ({','.join('?' * len(SERVER_INDEXES))})",
+                [name for name, _ in SERVER_INDEXES],
+            ).fetchone()[0] == len(SERVER_INDEXES)
+        except sqlite3.OperationalError:
+            analyzed = False  # sqlite_stat1 only exists after the first ANALYZE
+        if not analyzed:
+            conn.execute("ANALYZE questions")
+    finally:
+        conn.close()
+
+
+# Seconds between schema-setup attempts while another process (e.g. an ingest) holds the write lock
+SCHEMA_RETRY_SECONDS = 30
+
+
+def _is_lock_error(e: sqlite3.Error) -> bool:
+    return isinstance(e, sqlite3.OperationalError) and ("locked" in str(e) or "busy" in str(e))
+
+
+def _migrate_db_retrying() -> None:
+    while True:
+        time.sleep(SCHEMA_RETRY_SECONDS)
+        try:
+            _init_db()
+            return
+        except sqlite3.Error as e:
+            if not _is_lock_error(e):
+                print(f"[WARN] DB setup skipped: {e}")
+                return
+
+
+def _migrate_db() -> None:
+    """Run _init_db once at startup; if the DB is locked, keep retrying in the background."""
+    try:
+        _init_db()
+    except sqlite3.Error as e:
+        # Until it succeeds (or if it can't, e.g. a read-only file) quizzes use QUIZ_LEVEL_FILTERS_LIVE
+        print(f"[WARN] DB setup skipped: {e}")
+        if _is_lock_error(e):
+            print(f"[WARN] retrying DB setup every {SCHEMA_RETRY_SECONDS}s")
+            threading.Thread(target=_migrate_db_retrying, name="db-setup", daemon=True).start()
+
+
+def _data_version() -> int:
+    """Bumps whenever another connection (e.g. an init_db.py reload) commits to the DB."""
+    global _VERSION_CONN
+    with _VERSION_LOCK:
+        if _VERSION_CONN is None:
+            _VERSION_CONN = _open_conn()
+        return _VERSION_CONN.execute("PRAGMA data_version").fetchone()[0]
+
+
+# Plain frozen dataclass: rows come from our own schema (no validation needed), tools only
+# read the fields, and being hashable by value lets the formatters cache on it directly
+@dataclass(frozen=True, slots=True)
+class Question:
     id: str
     question: str
     subject: str
@@ -63,103 +295,149 @@ class Question(BaseModel):
     question_type: Optional[str] = None
 
 
-def get_all_subjects(conn: sqlite3.Connection) -> List[str]:
-    cur = conn.execute("SELECT DISTINCT subject FROM questions ORDER BY subject")
-    return [r[0] for r in cur.fetchall()]
+def _sorted_distinct(values: set) -> List[Optional[str]]:
+    # Same order as SQL ORDER BY: NULL first
+    return sorted(values, key=lambda v: (v is not None, v or ""))
 
 
-def get_all_question_types(conn: sqlite3.Connection) -> List[str]:
-    cur = conn.execute("SELECT DISTINCT question_type FROM questions ORDER BY question_type")
-    return [r[0] for r in cur.fetchall()]
+def get_subjects_and_question_types(conn: sqlite3.Connection) -> tuple:
+    """Distinct subjects and question types from one scan (covered by idx_q_subject_qtype)."""
+    pairs = conn.execute("SELECT DISTINCT subject, question_type FROM questions").fetchall()
+    return (
+        _sorted_distinct({subj for subj, _ in pairs}),
+        _sorted_distinct({qt for _, qt in pairs}),
+    )
 
 
-def normalize_subject(user_subject: Optional[str], available: List[str]) -> Optional[str]:
-    if not user_subject:
-        return None
-    s = user_subject.strip().lower()
-    if not s:
-        return None
-    # Simple synonym map
-    synonyms = {
-        "maths": "math",
-        "mathematics": "math",
-        "bio": "biology",
-        "chem": "chemistry",
-        "cs": "cs/ai",
-        "ai": "cs/ai",
-        "comp sci": "cs/ai",
-    }
-    s = synonyms.get(s, s)
-    # Case-insensitive partial match
-    for subj in available:
-        subj_l = (subj or "").lower()
-        if s == subj_l or s in subj_l or subj_l in s:
-            return subj
+# Common user phrasings -> canonical spelling (matched against DB values below)
+SUBJECT_SYNONYMS = {
+    "maths": "math",
+    "mathematics": "math",
+    "bio": "biology",
+    "chem": "chemistry",
+    "cs": "cs/ai",
+    "ai": "cs/ai",
+    "comp sci": "cs/ai",
+}
+# Most HLE entries in this app are stored as 'text'
+QTYPE_SYNONYMS = {p: "text" for p in ("mcq", "mcqs", "multiple choice", "multiple-choice", "choice")}
+
+
+def _match(term: str, lowered: tuple) -> Optional[str]:
+    # Case-insensitive partial match against (lowercase, original) pairs
+    for value_l, value in lowered:
+        if term == value_l or term in value_l or value_l in term:
+            return value
     return None
 
 
-def normalize_qtype(user_qtype: Optional[str], available: List[str]) -> Optional[str]:
-    if not user_qtype:
+def _build_canon(values: List[str], synonyms: Dict[str, str]) -> tuple:
+    lowered = tuple(((v or "").lower(), v) for v in values)
+    canon: Dict[str, str] = {}
+    for value_l, value in lowered:
+        if value:
+            canon.setdefault(value_l, value)
+    for phrase, target in synonyms.items():
+        hit = canon.get(target) or _match(target, lowered)
+        if hit:
+            canon[phrase] = hit
+    return canon, lowered
+
+
+@functools.lru_cache(maxsize=1)
+def _canon_maps(version: int) -> tuple:
+    """(subject map, qtype map), each a lowercase->DB value dict plus the list for partial matches."""
+    with get_conn() as conn:
+        subjects, qtypes = get_subjects_and_question_types(conn)
+    return _build_canon(subjects, SUBJECT_SYNONYMS), _build_canon(qtypes, QTYPE_SYNONYMS)
+
+
+def _normalize(value: Optional[str], which: int, synonyms: Dict[str, str], version: Optional[int]) -> Optional[str]:
+    if not value:
         return None
-    q = user_qtype.strip().lower()
-    if not q:
+    v = value.strip().lower()
+    if not v:
         return None
-    # Map common phrases
-    if q in {"mcq", "mcqs", "multiple choice", "multiple-choice", "choice"}:
-        # Most HLE entries in this app are stored as 'text'
-        q = "text"
-    for qt in available:
-        qt_l = (qt or "").lower()
-        if q == qt_l or q in qt_l or qt_l in q:
-            return qt
-    return None
+    if version is None:
+        version = _data_version()
+    canon, lowered = _canon_maps(version)[which]
+    # Exact/synonym hit is one dict lookup; partial matching only on a miss
+    return canon.get(v) or _match(synonyms.get(v, v), lowered)
+
+
+def normalize_subject(user_subject: Optional[str], version: Optional[int] = None) -> Optional[str]:
+    return _normalize(user_subject, 0, SUBJECT_SYNONYMS, version)
+
+
+def normalize_qtype(user_qtype: Optional[str], version: Optional[int] = None) -> Optional[str]:
+    return _normalize(user_qtype, 1, QTYPE_SYNONYMS, version)
+
 
 @mcp.tool
 async def validate() -> str:
     """Required by host to verify server ownership."""
     return MY_NUMBER
 
-def _wrap(text: str, width: int = 76) -> str:
-    return "\n".join(textwrap.wrap(text, width=width)) if text else ""
+# One TextWrapper per width, built on first use (the WhatsApp formatters all use 70).
+# fill() keeps no per-call state on the instance, so worker threads can share them.
+@functools.lru_cache(maxsize=None)
+def _wrapper(width: int) -> textwrap.TextWrapper:
+    return textwrap.TextWrapper(width=width)
+
+
+# Questions are re-rendered on every quiz step and repeat across calls, so memoize by value
+@functools.lru_cache(maxsize=512)
+def _wrap(text: str, width: int = 70) -> str:
+    if not text:
+        return ""
+    return _wrapper(width).fill(text)
 
 
 # ============ Summary tools ============
 
+SUMMARY_BUCKETS = ("subject", "difficulty", "question_type")
+
+
 def _get_db_summary(conn: sqlite3.Connection) -> dict:
-    total_questions = conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]
-
-    # Subject counts
-    subject_counts_rows = conn.execute(
-        """
-        SELECT subject, COUNT(*) as count
-        FROM questions
-        GROUP BY subject
-        ORDER BY count DESC
-        """
-    ).fetchall()
-    subject_counts = {row[0]: row[1] for row in subject_counts_rows}
-
-    # Difficulty counts
-    difficulty_counts_rows = conn.execute(
-        """
-        SELECT difficulty, COUNT(*) as count
-        FROM questions
-        GROUP BY difficulty
-        ORDER BY count DESC
-        """
-    ).fetchall()
-    difficulty_counts = {row[0]: row[1] for row in difficulty_counts_rows}
-
-    # Question type counts
-    qtype_counts_rows = conn.execute(
-        """
-        SELECT question_type, COUNT(*) as count
-        FROM questions
-        GROUP BY question_type
-        ORDER BY count DESC
-        """
-    ).fetchall()
-    question_type_counts = {row[0]: row[1] for row in qtype_counts_rows}
+    # Counts materialized by the ingest pipeline: a handful of rows, no table scan
+    try:
+        rows = conn.execute(
+            "SELECT bucket, key, count FROM summary_counts "
+            "WHERE bucket IN ('total', 'subject', 'difficulty', 'question_type')"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        rows = []  # DB built before summary_counts existed
+    # Only DatabaseManager refreshes summary_counts; if anything else changed the table,
+    # the stored total no longer matches the live count (COUNT(*) is an index-only scan)
+    stored_total = next((count for bucket, _, count in rows if bucket == "total"), None)
+    if stored_total != conn.execute("SELECT COUNT(*) FROM questions").fetchone()[0]:
+        rows = []
+    if not rows:
+        # One statement for the total and all three groupings: (bucket, key, count) rows
+        rows = conn.execute(
+            """
+            SELECT 'total', NULL, COUNT(*) FROM questions
+            UNION ALL
+            SELECT 'subject', subject, COUNT(*) FROM questions GROUP BY subject
+            UNION ALL
+            SELECT 'difficulty', difficulty, COUNT(*) FROM questions GROUP BY difficulty
+            UNION ALL
+            SELECT 'question_type', question_type, COUNT(*) FROM questions GROUP BY question_type
+            """
+        ).fetchall()
+
+    total_questions = 0
+    buckets: Dict[str, List[tuple]] = {b: [] for b in SUMMARY_BUCKETS}
+    for bucket, key, count in rows:
+        if bucket == "total":
+            total_questions = count
+        else:
+            buckets[bucket].append((key, count))
+
+    # Keep the previous ORDER BY count DESC presentation
+    subject_counts = dict(sorted(buckets["subject"], key=lambda kv: kv[1], reverse=True))
+    difficulty_counts = dict(sorted(buckets["difficulty"], key=lambda kv: kv[1], reverse=True))
+    question_type_counts = dict(sorted(buckets["question_type"], key=lambda kv: kv[1], reverse=True))
 
     return {
         "total_questions": total_questions,
@@ -172,118 +450,317 @@ def _get_db_summary(conn: sqlite3.Connection) -> dict:
     }
 
 
+@functools.lru_cache(maxsize=64)
+def _rowids_where(where: str, params: tuple, version: int) -> tuple:
+    """Rowids matching a filter, so sampling is a handful of B-tree lookups instead of ORDER BY RANDOM()."""
+    with get_conn() as conn:
+        return tuple(r[0] for r in conn.execute(f"SELECT rowid FROM questions WHERE {where}", params))
+
+
+# Fixed WHERE texts for the exam filters, keyed by (has subject, has question_type),
+# so each combination always maps to the same cached statement
+EXAM_FILTERS = {
+    (False, False): "1=1",
+    (True, False): "subject = ?",
+    (False, True): "question_type = ?",
+    (True, True): "subject = ? AND question_type = ?",
+}
+
+
+# Fixed WHERE texts for start_quiz_wa's difficulty levels (question length bins); None = any length
+QUIZ_LEVEL_FILTERS = {
+    None: "1=1",
+    1: "question_length < 80",
+    2: "question_length BETWEEN 80 AND 140",
+    3: "question_length BETWEEN 140 AND 220",
+    4: "question_length BETWEEN 220 AND 300",
+    5: "question_length > 300",
+}
+# The same bins computed per row, for DBs that predate question_length and were not migrated
+QUIZ_LEVEL_FILTERS_LIVE = {
+    None: "1=1",
+    1: "LENGTH(question) < 80",
+    2: "LENGTH(question) BETWEEN 80 AND 140",
+    3: "LENGTH(question) BETWEEN 140 AND 220",
+    4: "LENGTH(question) BETWEEN 220 AND 300",
+    5: "LENGTH(question) > 300",
+}
+
+
+def _exam_filter(subject: Optional[str], question_type: Optional[str]) -> tuple:
+    """(WHERE text, params) for the canonical exam filters."""
+    return EXAM_FILTERS[bool(subject), bool(question_type)], tuple(v for v in (subject, question_type) if v)
+
+
+@functools.lru_cache(maxsize=None)
+def _sample_sql(k: int) -> str:
+    # Always k placeholders (short draws are padded with NULL), so one statement text per k
+    return (
+        "SELECT id, question, subject, difficulty, question_type, answer FROM questions "
+        f"WHERE rowid IN ({','.join('?' * k)})"
+    )
+
+
+def _sample_questions(conn: sqlite3.Connection, rowids: tuple, k: int = 10) -> list:
+    """Up to k random rows from `rowids`, in random order."""
+    picks = random.sample(rowids, min(k, len(rowids)))
+    rows = conn.execute(_sample_sql(k), picks + [None] * (k - len(picks))).fetchall()
+    random.shuffle(rows)  # IN returns rows in rowid order
+    return rows
+
+
+def _fetch_random_rows(where: str, params: tuple, version: Optional[int] = None, k: int = 10) -> list:
+    """Up to k random (Question fields..., answer) rows matching `where`; the whole table when nothing matches."""
+    if version is None:
+        version = _data_version()
+    rowids = _rowids_where(where, params, version) or _rowids_where("1=1", (), version)
+    if not rowids:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message="No question available (database empty)"))
+    with get_conn() as conn:
+        rows = _sample_questions(conn, rowids, k)
+    if len(rows) < min(k, len(rowids)):
+        # Under-filled: the DB was reloaded after `rowids` was cached, so redraw against the new data
+        fresh = _data_version()
+        if fresh != version:
+            return _fetch_random_rows(where, params, fresh, k)
+    return rows
+
+
+def _fetch_random_questions(where: str, params: tuple, version: Optional[int] = None, k: int = 10) -> List[Question]:
+    # SELECT column order matches the Question fields; the trailing answer is not needed here
+    return [Question(*row[:-1]) for row in _fetch_random_rows(where, params, version, k)]
+
+
+@functools.lru_cache(maxsize=1)
+def _answers(version: int) -> Dict[str, tuple]:
+    """id -> (answer, _fold()ed answer, explanation) for every question, loaded once per data version."""
+    with get_conn() as conn:
+        rows = conn.execute("SELECT id, answer, explanation FROM questions")
+        return {qid: (ans, _fold(ans), expl or "") for qid, ans, expl in rows}
+
+
+@functools.lru_cache(maxsize=1)
+def _has_question_length(version: int) -> bool:
+    with get_conn() as conn:
+        return any(row[1] == "question_length" for row in conn.execute("PRAGMA table_info(questions)"))
+
+
+def _start_quiz(level: Optional[int]) -> "SessionState":
+    """A new quiz session: questions, ground truth and rendered prompts, from the one sampling query."""
+    version = _data_version()
+    filters = QUIZ_LEVEL_FILTERS if _has_question_length(version) else QUIZ_LEVEL_FILTERS_LIVE
+    rows = _fetch_random_rows(filters.get(level, filters[None]), (), version)
+    questions = [Question(*row[:-1]) for row in rows]
+    total = len(questions)
+    return SessionState(
+        questions=questions,
+        answers=[_fold(row[-1]) for row in rows],
+        prompts=[_format_single_question_wa(q, idx, total) for idx, q in enumerate(questions, start=1)],
+    )
+
+
+def _answer_entry(question_id: str) -> Optional[tuple]:
+    return _answers(_data_version()).get(question_id)
+
+
+def _check_answer_core(question_id: str, answer_norm: str) -> tuple:
+    """(is_correct, ground truth, explanation) for an already _fold()ed answer."""
+    entry = _answer_entry(question_id)
+    if entry is None:
+        raise McpError(ErrorData(code=INVALID_PARAMS, message="Unknown question id"))
+    gt_raw, gt, expl = entry
+    return _answer_matches(answer_norm, gt), gt_raw, expl
+
+
+@functools.lru_cache(maxsize=1)
+def _cached_db_summary(version: int) -> dict:
+    # `version` is only the cache key; a new value evicts the previous summary
+    with get_conn() as conn:
+        return _get_db_summary(conn)
+
+
+@functools.lru_cache(maxsize=1)
+def _cached_db_summary_wa(version: int) -> str:
+    # The rendered text only changes with the data, so repeat calls are a cache hit
+    return _format_db_summary_wa(_cached_db_summary(version))
+
+
+def _db_summary_wa_text() -> str:
+    return _cached_db_summary_wa(_data_version())
+
+
+def _draw_exam(subject: Optional[str], question_type: Optional[str]) -> List[Question]:
+    version = _data_version()
+    subj_canon = normalize_subject(subject, version)
+    qtype_canon = normalize_qtype(question_type, version)
+    where, params = _exam_filter(subj_canon, qtype_canon)
+    return _fetch_random_questions(where, params, version)
+
+
+async def _db(fn, *args):
+    """Run a blocking DB helper on a worker thread so the event loop keeps serving other calls."""
+    return await asyncio.to_thread(fn, *args)
+
+
 # (Removed non-WA summary and pretty variants to keep WA-only tools)
 
 
 # ============ WhatsApp-friendly tools ============
 
-def _format_question_wa(q: Question) -> str:
-    parts: List[str] = [
-        "*HLE Question*",
-        _wrap(q.question.strip(), 70),
-        "",
-    ]
-    if q.subject:
-        parts.append(f"- 📚 Subject: {q.subject}")
-    if q.difficulty:
-        parts.append(f"- 🎯 Difficulty: {q.difficulty}")
-    if q.question_type:
-        parts.append(f"- 🧩 Type: {q.question_type}")
-    parts.append(f"- 🆔 `{q.id}`")
-    return "\n".join(parts)
+# Fixed WhatsApp templates, filled with str.format_map
+_META_LINES = (
+    # (Question field, line) — emitted only when the field is set
+    ("subject", "📚 Subject: {subject}"),
+    ("difficulty", "🎯 Difficulty: {difficulty}"),
+    ("question_type", "🧩 Type: {question_type}"),
+)
+_ID_LINE = "🆔 `{id}`"
+_QUIZ_ITEM = "*{idx}.* {body}"
+_ANSWER_TEMPLATE = "*Result*\n{verdict}\n🔎 Ground truth: {ground_truth}"
+_EXPLANATION_TEMPLATE = "\n\n*Explanation*\n{explanation}"
+
+
+def _fields(q: Question) -> dict:
+    # Template mapping for format_map (slots dataclasses have no __dict__)
+    return {name: getattr(q, name) for name in Question.__slots__}
+
+
+def _meta_lines(fields: dict, bullet: str) -> Iterator[str]:
+    for name, template in _META_LINES:
+        if fields[name]:
+            yield bullet + template.format_map(fields)
 
 
+@functools.lru_cache(maxsize=1024)
 def _format_answer_wa(is_correct: bool, ground_truth: str, explanation: str) -> str:
-    header = "*Result*"
-    verdict = "✅ Correct" if is_correct else "❌ Incorrect"
-    lines: List[str] = [
-        header,
-        verdict,
-        f"🔎 Ground truth: {ground_truth}",
-    ]
+    text = _ANSWER_TEMPLATE.format_map({
+        "verdict": "✅ Correct" if is_correct else "❌ Incorrect",
+        "ground_truth": ground_truth,
+    })
     if explanation:
-        lines += ["", "*Explanation*", _wrap(explanation, 70)]
+        text += _EXPLANATION_TEMPLATE.format_map({"explanation": _wrap(explanation)})
+    return text
+
+
+# Memoized on the (hashable) Question: the same questions recur across exam draws
+@functools.lru_cache(maxsize=1024)
+def _quiz_item(q: Question) -> str:
+    fields = _fields(q)
+    lines = [_wrap(q.question.strip())]
+    lines.extend(_meta_lines(fields, "   - "))
+    lines.append("   - " + _ID_LINE.format_map(fields))
     return "\n".join(lines)
 
 
+def _quiz_lines(questions: List[Question]) -> Iterator[str]:
+    for idx, q in enumerate(questions, start=1):
+        yield ""
+        yield _QUIZ_ITEM.format_map({"idx": idx, "body": _quiz_item(q)})
+
+
 def _format_quiz_wa(questions: List[Question]) -> str:
     header = f"*HLE Quiz* — {len(questions)} question{'s' if len(questions) != 1 else ''}"
-    lines: List[str] = [header, ""]
-    for idx, q in enumerate(questions, start=1):
-        lines.append(f"*{idx}.* {_wrap(q.question.strip(), 70)}")
-        if q.subject:
-            lines.append(f"   - 📚 Subject: {q.subject}")
-        if q.difficulty:
-            lines.append(f"   - 🎯 Difficulty: {q.difficulty}")
-        if q.question_type:
-            lines.append(f"   - 🧩 Type: {q.question_type}")
-        lines.append(f"   - 🆔 `{q.id}`")
-        lines.append("")
-    # Remove trailing blank line
-    if lines and lines[-1] == "":
-        lines.pop()
-    return "\n".join(lines)
+    # Blank separator lines come before each question, so nothing trails the last one
+    return "\n".join(itertools.chain((header,), _quiz_lines(questions)))
 
 
+# Not memoized: each quiz renders its prompts once, at start (see _start_quiz)
 def _format_single_question_wa(q: Question, idx: int, total: int) -> str:
-    header = f"*Question {idx}/{total}*"
-    parts: List[str] = [
-        header,
-        _wrap(q.question.strip(), 70),
-        "",
-    ]
-    if q.subject:
-        parts.append(f"- 📚 Subject: {q.subject}")
-    if q.difficulty:
-        parts.append(f"- 🎯 Difficulty: {q.difficulty}")
-    if q.question_type:
-        parts.append(f"- 🧩 Type: {q.question_type}")
     # Intentionally do not expose the question ID to the end user
-    return "\n".join(parts)
+    return f"*Question {idx}/{total}*\n{_wrap(q.question.strip())}\n" + "".join(
+        "\n" + line for line in _meta_lines(_fields(q), "- ")
+    )
+
+
+# (heading, stats key) for each breakdown in the DB summary
+_SUMMARY_SECTIONS = (
+    ("*By subject*", "subject_counts"),
+    ("*By difficulty*", "difficulty_counts"),
+    ("*By question type*", "question_type_counts"),
+)
+
+
+def _summary_lines(stats: dict) -> Iterator[str]:
+    yield "*DB Summary*"
+    yield f"*Total questions*: {stats['total_questions']}"
+    for heading, key in _SUMMARY_SECTIONS:
+        yield ""
+        yield heading
+        for name, count in stats[key].items():
+            yield f"- {name}: {count}"
+
+
+def _format_db_summary_wa(stats: dict) -> str:
+    return "\n".join(_summary_lines(stats))
 
 
 @dataclass
 class SessionState:
     questions: List[Question]
+    # _fold()ed ground truth, parallel to `questions`; server-side only
+    answers: List[str]
+    # "*Question i/n*" prompts, rendered once at quiz start
+    prompts: List[str]
     current_index: int = 0
     correct_count: int = 0
+    last_active: float = field(default_factory=time.monotonic)
+
+
+# Abandoned quizzes are dropped after this much inactivity, and the least recently
+# used ones once there are more than MAX_SESSIONS
+SESSION_TTL_SECONDS = 1800
+MAX_SESSIONS = 10_000
+
+
+class SessionStore:
+    """user_id -> SessionState, kept in least-recently-used order (only touched from the event loop)."""
+
+    def __init__(self, maxsize: int = MAX_SESSIONS, ttl: float = SESSION_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._sessions: "OrderedDict[str, SessionState]" = OrderedDict()
+
+    def get(self, user_id: str) -> Optional[SessionState]:
+        """The user's session, or None if there is none or it expired."""
+        state = self._sessions.get(user_id)
+        if state is None:
+            return None
+        now = time.monotonic()
+        if now - state.last_active > self.ttl:
+            del self._sessions[user_id]
+            return None
+        state.last_active = now
+        self._sessions.move_to_end(user_id)
+        return state
+
+    def __setitem__(self, user_id: str, state: SessionState) -> None:
+        self._sessions[user_id] = state
+        self._sessions.move_to_end(user_id)
+        self._prune(state.last_active)
 
+    def pop(self, user_id: str, default: Optional[SessionState] = None) -> Optional[SessionState]:
+        return self._sessions.pop(user_id, default)
 
-QUIZ_SESSIONS: Dict[str, SessionState] = {}
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _prune(self, now: float) -> None:
+        # Oldest first, so expired sessions are all at the front
+        while self._sessions:
+            user_id, state = next(iter(self._sessions.items()))
+            if now - state.last_active <= self.ttl and len(self._sessions) <= self.maxsize:
+                break
+            del self._sessions[user_id]
+
+
+QUIZ_SESSIONS = SessionStore()
 
 @mcp.tool(description="Welcome to Humanity's Final Exam. A battle between Human And AI")
 async def Start_Final_Exam(
     subject: Annotated[Optional[str], Field(description="Optional subject filter (e.g., Physics)")] = None,
     question_type: Annotated[Optional[str], Field(description="Optional question type filter")] = None,
 ) -> str:
-    with get_conn() as conn:
-        subjects = get_all_subjects(conn)
-        qtypes = get_all_question_types(conn)
-
-        subj_canon = normalize_subject(subject, subjects)
-        qtype_canon = normalize_qtype(question_type, qtypes)
-
-        sql = "SELECT id, question, subject, difficulty, question_type FROM questions WHERE 1=1"
-        params: list = []
-        if subj_canon:
-            sql += " AND subject = ?"
-            params.append(subj_canon)
-        if qtype_canon:
-            sql += " AND question_type = ?"
-            params.append(qtype_canon)
-        sql += " ORDER BY RANDOM() LIMIT 10"
-
-        cur = conn.execute(sql, params)
-        rows = cur.fetchall()
-        if not rows:
-            cur = conn.execute(
-                "SELECT id, question, subject, difficulty, question_type FROM questions ORDER BY RANDOM() LIMIT 10"
-            )
-            rows = cur.fetchall()
-        if not rows:
-            raise McpError(ErrorData(code=INVALID_PARAMS, message="No question available (database empty)"))
-        questions = [Question(**dict(r)) for r in rows]
-        return _format_quiz_wa(questions)
+    return _format_quiz_wa(await _db(_draw_exam, subject, question_type))
 
 
 @mcp.tool(description="Start a 10-question WhatsApp quiz (one-by-one). Random subject/type; optional difficulty_level 1-5. Returns the first question. Requires user_id.")
@@ -291,43 +768,17 @@ async def start_quiz_wa(
     user_id: Annotated[str, Field(description="Unique user id (e.g., phone number)")],
     difficulty_level: Annotated[Optional[int], Field(description="Optional difficulty 1-5: 1 easiest, 5 hardest (based on length)")] = None,
 ) -> str:
-    with get_conn() as conn:
-        sql = "SELECT id, question, subject, difficulty, question_type FROM questions WHERE 1=1"
-        params: list = []
-        # Map difficulty_level (1..5) to length-based bins
-        try:
-            lvl = int(difficulty_level) if difficulty_level is not None else None
-        except Exception:
-            lvl = None
-        if lvl is not None and 1 <= lvl <= 5:
-            if lvl == 1:
-                sql += " AND LENGTH(question) < 80"
-            elif lvl == 2:
-                sql += " AND LENGTH(question) BETWEEN 80 AND 140"
-            elif lvl == 3:
-                sql += " AND LENGTH(question) BETWEEN 140 AND 220"
-            elif lvl == 4:
-                sql += " AND LENGTH(question) BETWEEN 220 AND 300"
-            elif lvl == 5:
-                sql += " AND LENGTH(question) > 300"
-        sql += " ORDER BY RANDOM() LIMIT 10"
-
-        cur = conn.execute(sql, params)
-        rows = cur.fetchall()
-        if not rows:
-            cur = conn.execute(
-                "SELECT id, question, subject, difficulty, question_type FROM questions ORDER BY RANDOM() LIMIT 10"
-            )
-            rows = cur.fetchall()
-        if not rows:
-            raise McpError(ErrorData(code=INVALID_PARAMS, message="No question available (database empty)"))
-
-    questions = [Question(**dict(r)) for r in rows]
+    # Map difficulty_level (1..5) to length-based bins; anything else is unfiltered
+    try:
+        lvl = int(difficulty_level) if difficulty_level is not None else None
+    except Exception:
+        lvl = None
+
+    # Filtered rows if any match, otherwise an unfiltered draw
+    state = await _db(_start_quiz, lvl)
     # Start/overwrite session for this user
-    QUIZ_SESSIONS[user_id] = SessionState(questions=questions)
-
-    first = questions[0]
-    return _format_single_question_wa(first, idx=1, total=len(questions))
+    QUIZ_SESSIONS[user_id] = state
+    return state.prompts[0]
 
 
 @mcp.tool(description="WhatsApp-friendly formatted answer check.")
@@ -335,18 +786,11 @@ async def check_answer_wa(
     question_id: Annotated[str, Field(description="The question id returned by play_exam")],
     answer: Annotated[str, Field(description="User's answer text")],
 ) -> str:
-    answer_norm = (answer or "").strip().lower()
+    answer_norm = _fold(answer)
     if not answer_norm:
         raise McpError(ErrorData(code=INVALID_PARAMS, message="Answer cannot be empty"))
-    with get_conn() as conn:
-        cur = conn.execute("SELECT answer, explanation FROM questions WHERE id = ?", (question_id,))
-        row = cur.fetchone()
-        if not row:
-            raise McpError(ErrorData(code=INVALID_PARAMS, message="Unknown question id"))
-        gt = (row["answer"] or "").strip().lower()
-        is_correct = (answer_norm == gt) or (gt in answer_norm) or (answer_norm in gt)
-        expl = row["explanation"] or ""
-        return _format_answer_wa(is_correct=is_correct, ground_truth=row["answer"], explanation=expl)
+    is_correct, ground_truth, explanation = await _db(_check_answer_core, question_id, answer_norm)
+    return _format_answer_wa(is_correct=is_correct, ground_truth=ground_truth, explanation=explanation)
 
 
 @mcp.tool(description="Submit an answer for the current question. Returns verdict and next question or final score. Requires user_id.")
@@ -362,20 +806,13 @@ async def answer_quiz_wa(
     if state.current_index >= len(state.questions):
         return f"Quiz already completed. Score: {state.correct_count}/{len(state.questions)}"
 
-    current_q = state.questions[state.current_index]
-    normalized_answer = (answer or "").strip().lower()
+    normalized_answer = _fold(answer)
     if not normalized_answer:
         raise McpError(ErrorData(code=INVALID_PARAMS, message="Answer cannot be empty"))
 
-    # Look up ground truth from DB to avoid exposing in session state
-    with get_conn() as conn:
-        cur = conn.execute("SELECT answer FROM questions WHERE id = ?", (current_q.id,))
-        row = cur.fetchone()
-        if not row:
-            raise McpError(ErrorData(code=INVALID_PARAMS, message="Question not found in DB"))
-        gt = (row[0] or "").strip().lower()
-
-    is_correct = (normalized_answer == gt) or (gt in normalized_answer) or (normalized_answer in gt)
+    # Ground truth was loaded with the quiz, so scoring needs no DB round-trip (and no await,
+    # which also keeps two submissions for the same question from both being scored)
+    is_correct = _answer_matches(normalized_answer, state.answers[state.current_index])
     if is_correct:
         state.correct_count += 1
 
@@ -393,42 +830,17 @@ async def answer_quiz_wa(
         QUIZ_SESSIONS.pop(user_id, None)
         return "\n".join([verdict, score_line])
 
-    next_q = state.questions[state.current_index]
-    prompt_next = _format_single_question_wa(next_q, idx=state.current_index + 1, total=len(state.questions))
-    return "\n".join([verdict, "", prompt_next])
+    return "\n".join([verdict, "", state.prompts[state.current_index]])
 
 
 @mcp.tool(description="WhatsApp-friendly formatted database summary.")
 async def db_summary_wa() -> str:
-    with get_conn() as conn:
-        stats = _get_db_summary(conn)
-
-    lines: List[str] = [
-        "*DB Summary*",
-        f"*Total questions*: {stats['total_questions']}",
-        "",
-        "*By subject*",
-    ]
-    for subj, count in stats["subject_counts"].items():
-        lines.append(f"- {subj}: {count}")
-    lines += [
-        "",
-        "*By difficulty*",
-    ]
-    for diff, count in stats["difficulty_counts"].items():
-        lines.append(f"- {diff}: {count}")
-    lines += [
-        "",
-        "*By question type*",
-    ]
-    for qt, count in stats["question_type_counts"].items():
-        lines.append(f"- {qt}: {count}")
-
-    return "\n".join(lines)
+    return await _db(_db_summary_wa_text)
 
 
 
 async def main():
+    _migrate_db()
     print(f"🚀 HLE MCP on http://0.0.0.0:8086  (DB: {DB_PATH})")
     await mcp.run_async("streamable-http", host="0.0.0.0", port=8086)
 
@@ -0,0 +1,70 @@
+"""Answer matching used by check_answer_wa / answer_quiz_wa (run: python -m unittest discover tests)."""
+
+import importlib.util
+import os
+import pathlib
+import unittest
+
+SERVER = pathlib.Path(__file__).resolve().parents[1] / "mcp_server" / "mcp_hle_server.py"
+
+
+def _load_server():
+    os.environ.setdefault("AUTH_TOKEN", "test")
+    os.environ.setdefault("DB_PATH", os.devnull)
+    spec = importlib.util.spec_from_file_location("mcp_hle_server", SERVER)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+try:
+    srv = _load_server()
+except ImportError as exc:  # server extra (fastmcp, dotenv) not installed
+    srv = None
+    SKIP_REASON = str(exc)
+else:
+    SKIP_REASON = ""
+
+
+@unittest.skipIf(srv is None, SKIP_REASON)
+class AnswerMatchingTest(unittest.TestCase):
+    def matches(self, answer: str, ground_truth: str) -> bool:
+        return srv._answer_matches(srv._fold(answer), srv._fold(ground_truth))
+
+    def test_exact_and_contained_answers_match(self):
+        self.assertTrue(self.matches("42", "42"))
+        self.assertTrue(self.matches(" STRASSE ", "Straße"))
+        self.assertTrue(self.matches("the answer is 42", "42"))
+        self.assertTrue(self.matches("Café", "cafe"))
+
+    def test_near_miss_answers_do_not_match(self):
+        for answer, ground_truth in (
+            ("answer 4", "Answer 3"),
+            ("2.7182", "2.7183"),
+            ("123456789013", "123456789012"),
+            ("43", "42"),
+            ("mitochondrion", "mitochondria"),
+        ):
+            with self.subTest(answer=answer, ground_truth=ground_truth):
+                self.assertFalse(self.matches(answer, ground_truth))
+
+    def test_math_symbols_are_significant(self):
+        for answer, ground_truth in (
+            ("x+1", "x-1"),
+            ("1/2", "1.2"),
+            ("10^6", "10.6"),
+            ("x^2", "x_2"),
+            ("e^{-1}", "e-1"),
+            ("(1,2)", "[1,2]"),
+            ("x²", "x2"),
+        ):
+            with self.subTest(answer=answer, ground_truth=ground_truth):
+                self.assertFalse(self.matches(answer, ground_truth))
+
+    @unittest.skipIf(srv is not None and srv.fuzz is None, "rapidfuzz not installed")
+    def test_small_typo_in_long_word_answer_matches(self):
+        self.assertTrue(self.matches("photosynthsis", "photosynthesis"))
+
+
+if __name__ == "__main__":
+    unittest.main()